@@ -2,47 +2,208 @@
 # this is anna d'addio copyright, please do not reproduce without the right citation
 
 
-import io, os, glob
+import io, os, glob, hashlib, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
 import pycountry
-from streamlit_plotly_events import plotly_events
 
 st.set_page_config(page_title="PEER Data Portal", layout="wide")
 
 # ─── 1. Ensure the session‐store exists ─────────────────────────────
 if "store" not in st.session_state or not isinstance(st.session_state.store, dict):
     st.session_state.store = {}
+if "fingerprints" not in st.session_state:
+    st.session_state.fingerprints = {}
 
 # ─── 2. Auto‐load from data/ on first run ───────────────────────────
-def autoload():
-    patterns = glob.glob("data/*.xlsx") + glob.glob("data/*.csv")
-    for path in patterns:
+def _clean(df0, name):
+    # Column names as strings, so a sheet with a numeric header (e.g.
+    # 2020) gives widgets, cache keys and the Arrow preview one name type
+    df0.columns = [str(c) for c in df0.columns]
+
+    # Recode Yes/No → 1/0 in one pass over the text columns; fully
+    # answered columns become int8, the rest keep NaN as float
+    obj = df0.select_dtypes(include=["object", "string"])
+    yes_no = (obj.isin(["Yes", "No"]) | obj.isna()).all()
+    cols = yes_no.index[yes_no]
+    if len(cols):
+        block = obj[cols].to_numpy(dtype=object, na_value=None)
+        codes = pd.DataFrame(
+            np.where(block == "Yes", 1.0, np.where(block == "No", 0.0, np.nan)),
+            index=df0.index, columns=cols
+        )
+        full = codes.columns[codes.notna().all()]
+        codes[full] = codes[full].astype("int8")
+        df0[cols] = codes
+
+    # Text columns holding only numbers are parsed once here, so the
+    # chart section doesn't re-coerce them on every rerun. Only when the
+    # numbers print back as written: codes like "004" or "1.50" stay text.
+    txt = df0.select_dtypes(include=["object", "string"]).columns.difference(
+        ["Theme", "Country", "Region", "Income"], sort=False)
+    for c in txt:
+        has = df0[c].notna()
+        col = pd.to_numeric(df0[c], errors="coerce")
+        if not has.any() or col.notna().sum() != has.sum():
+            continue
+        back = col[has].map(
+            lambda v: str(int(v)) if float(v).is_integer() else repr(float(v)))
+        if (df0[c][has].astype(str) == back).all():
+            df0[c] = col
+
+    # Downcast numeric indicators: whole-number columns to the smallest
+    # int, the rest to float32 when that is lossless (groupby/agg are
+    # memory-bound, but downloads must keep the exact values)
+    num = df0.select_dtypes(include="number").columns.difference(
+        ["Theme", "Country", "Region", "Income"], sort=False)
+    for c in num:
+        col = pd.to_numeric(df0[c], downcast="integer")
+        if col.dtype.kind not in "iu":
+            f32 = col.astype("float32")
+            if f32.astype("float64").equals(col.astype("float64")):
+                col = f32
+        df0[c] = col
+
+    # Ensure Theme column
+    if "Theme" not in df0.columns:
+        df0["Theme"] = name.rsplit(".", 1)[0]
+    return df0
+
+def _read_table(src, name):
+    # calamine (Rust) parses xlsx several times faster than openpyxl
+    if name.endswith(".xlsx"):
+        try:
+            return pd.read_excel(src, engine="calamine")
+        except ImportError:
+            return pd.read_excel(src)
+    return pd.read_csv(src)
+
+# Parsed files are cached across reruns: data/ as a whole by each file's
+# path, mtime and size (_folder_store below), uploads by their raw bytes.
+# Cleaned data/ files are also written to data/.cache/, so a fresh process
+# skips the Excel parse for any file whose mtime and size are unchanged.
+# The copy is a pickle: most indicators mix numbers with text (".." gaps),
+# and only object columns keep those cells as numbers for the downloads.
+CACHE_DIR = os.path.join("data", ".cache")
+CACHE_VERSION = 5  # bump when _clean changes what it produces
+TMP_MAX_AGE = 3600  # seconds before an orphaned *.tmp is removed
+
+# Plain function: it runs on _folder_store's worker threads, which have
+# no script context for st.cache_data
+def _load_one(path, mtime_ns, size):
+    base = os.path.basename(path)
+    cached = os.path.join(CACHE_DIR, f"{base}.{mtime_ns}.{size}.v{CACHE_VERSION}.pkl")
+    if os.path.exists(cached):
+        try:
+            return pd.read_pickle(cached)
+        except Exception:
+            # unreadable (e.g. truncated) copy: drop it, parse the source
+            try:
+                os.remove(cached)
+            except OSError:
+                pass
+    df0 = _clean(_read_table(path, path), base)
+    tmp = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for ext in ("pkl", "parquet"):  # .parquet: copies from older versions
+            for stale in glob.glob(os.path.join(CACHE_DIR, glob.escape(base) + f".*.{ext}")):
+                os.remove(stale)
+        # temp files left by a writer killed before its rename; recent ones
+        # may still be in use by another process
+        for stale in glob.glob(os.path.join(CACHE_DIR, "*.tmp")):
+            try:
+                if time.time() - os.path.getmtime(stale) > TMP_MAX_AGE:
+                    os.remove(stale)
+            except OSError:
+                pass
+        # write aside and rename, so a killed process or a second replica
+        # never leaves a half-written file under the final name. The temp
+        # file is opened normally (unique per process and thread), so its
+        # mode follows the umask like any other file the app writes.
+        tmp = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df0.to_pickle(tmp)
+        os.replace(tmp, cached)
+    except Exception:
+        # read-only checkout: parse next time
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+    return df0
+
+@st.cache_data(show_spinner=False)
+def _load_upload(name, data):
+    return _clean(_read_table(io.BytesIO(data), name), name)
+
+def fingerprint(df0):
+    # Content hash of a store frame, used as the cache key for anything
+    # derived from it (so cached results survive reruns and sessions)
+    rows = pd.util.hash_pandas_object(df0, index=False).to_numpy()
+    h = hashlib.sha1(rows.tobytes())
+    h.update(repr(list(df0.columns)).encode())
+    return h.hexdigest()
+
+# Columns used as keys/filters are stored as categoricals: isin/unique
+# then work on the small integer codes instead of Python strings
+CATEGORY_COLS = ("Theme", "Region", "Income", "Country")
+
+def merge_into_store(frames, store=None, fingerprints=None):
+    # Collect every part per theme, then concat once per theme
+    # (into this session's store unless given other dicts)
+    if store is None:
+        store, fingerprints = st.session_state.store, st.session_state.fingerprints
+    pending = defaultdict(list)
+    for df0 in frames:
+        for raw, part in df0.groupby("Theme", sort=False):
+            pending[str(raw)].append(part)
+    for theme, parts in pending.items():
+        old = store.get(theme)
+        merged = pd.concat(([old] if old is not None else []) + parts,
+                           ignore_index=True)
+        # (re-)cast after the concat so every part shares one category set
+        for c in CATEGORY_COLS:
+            if c in merged.columns:
+                merged[c] = merged[c].astype("category")
+        store[theme] = merged
+        fingerprints[theme] = fingerprint(merged)
+
+# data/ is the same for every visitor: it is parsed and merged once per
+# process (per set of file stamps) and the frames are shared by sessions.
+# Uploads replace a theme's frame with a new concat, never mutate it.
+# Only the current folder state is kept: an older store is dropped once
+# any file's stamp changes.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _folder_store(stamp):
+    # Files are independent: parse them concurrently, merge in this thread
+    with ThreadPoolExecutor(max_workers=min(8, len(stamp) or 1)) as ex:
+        jobs = [(path, ex.submit(_load_one, path, mtime_ns, size))
+                for path, mtime_ns, size in stamp]
+    frames, errors = [], []
+    for path, job in jobs:
         try:
-            df0 = pd.read_excel(path) if path.endswith(".xlsx") else pd.read_csv(path)
+            frames.append(job.result())
         except Exception as e:
-            st.warning(f"Could not read {os.path.basename(path)}: {e}")
-            continue
+            errors.append(f"Could not read {os.path.basename(path)}: {e}")
+    store, fingerprints = {}, {}
+    merge_into_store(frames, store, fingerprints)
+    return store, fingerprints, errors
 
-        # Recode Yes/No → 1/0
-        for col in df0.columns:
-            if df0[col].dropna().isin(["Yes", "No"]).all():
-                df0[col] = df0[col].map({"Yes": 1, "No": 0})
-
-        # Ensure Theme column
-        if "Theme" not in df0.columns:
-            df0["Theme"] = os.path.basename(path).rsplit(".", 1)[0]
-
-        # Merge into store by theme
-        for raw in df0["Theme"].unique():
-            theme = str(raw)
-            part = df0[df0["Theme"] == raw].copy()
-            st.session_state.store[theme] = pd.concat(
-                [st.session_state.store.get(theme, pd.DataFrame()), part],
-                ignore_index=True
-            )
+def autoload():
+    paths = glob.glob("data/*.xlsx") + glob.glob("data/*.csv")
+    # mtime in ns plus size: a sheet rewritten within the same second
+    # still gets a new stamp
+    stats = [(path, os.stat(path)) for path in paths]
+    stamp = tuple((path, s.st_mtime_ns, s.st_size) for path, s in stats)
+    store, fingerprints, errors = _folder_store(stamp)
+    for msg in errors:
+        st.warning(msg)
+    st.session_state.store = dict(store)
+    st.session_state.fingerprints = dict(fingerprints)
 
 if not st.session_state.store:
     autoload()
@@ -55,28 +216,13 @@ with st.sidebar:
         accept_multiple_files=True, type=["xlsx", "csv"]
     )
     if st.button("Add to portal") and uploads:
+        frames = []
         for f in uploads:
             try:
-                df1 = pd.read_excel(f) if f.name.endswith(".xlsx") else pd.read_csv(f)
+                frames.append(_load_upload(f.name, f.getvalue()))
             except Exception as e:
                 st.error(f"Failed to load {f.name}: {e}")
-                continue
-
-            # Yes/No → 1/0
-            for col in df1.columns:
-                if df1[col].dropna().isin(["Yes", "No"]).all():
-                    df1[col] = df1[col].map({"Yes": 1, "No": 0})
-
-            if "Theme" not in df1.columns:
-                df1["Theme"] = f.name.rsplit(".", 1)[0]
-
-            for raw in df1["Theme"].unique():
-                theme = str(raw)
-                part = df1[df1["Theme"] == raw].copy()
-                st.session_state.store[theme] = pd.concat(
-                    [st.session_state.store.get(theme, pd.DataFrame()), part],
-                    ignore_index=True
-                )
+        merge_into_store(frames)
         st.success("Datasets added!")
 
 # ─── 4. Main UI ───────────────────────────────────────────────────────
@@ -89,68 +235,140 @@ theme = st.selectbox("Theme", sorted(st.session_state.store.keys()))
 df    = st.session_state.store[theme]
 
 # ─── 5. Optional filters ───────────────────────────────────────────────
+# Sorted option lists only change with the theme's content. They are
+# immutable tuples, so cache_resource can hand out the shared object
+# instead of unpickling a copy on every rerun like cache_data does.
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _options(_df, key):
+    return tuple(tuple(sorted(_df[c].cat.categories.tolist()))
+                 for c in ("Region", "Income", "Country"))
+
+region_opts, income_opts, country_opts = _options(df, st.session_state.fingerprints[theme])
 regions   = st.multiselect(
     "Region(s) (optional)", 
-    options=sorted(df["Region"].dropna().unique()), default=[]
+    options=region_opts, default=[]
 )
 incomes   = st.multiselect(
     "Income group(s) (optional)", 
-    options=sorted(df["Income"].dropna().unique()), default=[]
+    options=income_opts, default=[]
 )
 countries = st.multiselect(
     "Country(ies) (optional)", 
-    options=sorted(df["Country"].unique()), default=[]
+    options=country_opts, default=[]
 )
 
-mask = pd.Series(True, index=df.index)
-if regions:
-    mask &= df["Region"].isin(regions)
-if incomes:
-    mask &= df["Income"].isin(incomes)
-if countries:
-    mask &= df["Country"].isin(countries)
-data = df.loc[mask, ["Country","Region","Income"] + [c for c in df.columns 
-           if c not in ("Theme","Country","Region","Income")]].copy()
+# Filtering is cached per (theme content, selection), so reruns triggered
+# by unrelated widgets reuse the filtered frame
+def _codes_mask(col, selected):
+    # Boolean lookup table over the categories, indexed by each row's
+    # code: O(1) membership per row. The extra last slot catches NaN (-1).
+    wanted = col.cat.categories.get_indexer(list(selected))
+    lut = np.zeros(len(col.cat.categories) + 1, dtype=bool)
+    lut[wanted[wanted >= 0]] = True
+    return lut[col.cat.codes.to_numpy()]
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _filter(_df, key, regions, incomes, countries):
+    mask = np.ones(len(_df), dtype=bool)
+    for col, selected in (("Region", regions), ("Income", incomes),
+                          ("Country", countries)):
+        if not selected:
+            continue
+        # every category picked (and no blanks to drop): nothing to test
+        if (len(set(selected)) == len(_df[col].cat.categories)
+                and not _df[col].hasnans):
+            continue
+        mask &= _codes_mask(_df[col], selected)
+    # one positional take for rows and columns, no label alignment
+    cols = [_df.columns.get_loc(c) for c in ("Country","Region","Income")] + [
+        i for i, c in enumerate(_df.columns)
+        if c not in ("Theme","Country","Region","Income")]
+    if mask.all():
+        return _df.iloc[:, cols]
+    return _df.iloc[np.flatnonzero(mask), cols]
+
+# identifies the filtered frame for every cache further down
+data_key = (st.session_state.fingerprints[theme],
+            tuple(regions), tuple(incomes), tuple(countries))
+data = _filter(df, *data_key)
+
+# Country → profile URL for chart clicks, once per filtered frame. Built
+# here, before the selected indicators are coerced to numbers (the key
+# doesn't cover sel_inds, and SnapshotURL can be picked as one).
+@st.cache_data(show_spinner=False, max_entries=32)
+def _snapshot_urls(_data, key):
+    if "SnapshotURL" not in _data.columns:
+        return {}
+    urls = _data[["Country","SnapshotURL"]].dropna().drop_duplicates("Country")
+    return dict(zip(urls["Country"].astype(str), urls["SnapshotURL"]))
+
+snap_urls = _snapshot_urls(data, data_key)
 
 st.subheader("Filtered data")
-st.dataframe(data, use_container_width=True)
+# Only the preview is trimmed; downloads below still get every row
+MAX_PREVIEW = 1000
+st.dataframe(data.head(MAX_PREVIEW), use_container_width=True)
+if len(data) > MAX_PREVIEW:
+    st.caption(f"Showing first {MAX_PREVIEW:,} of {len(data):,} rows — download for full data.")
 # ─── 7. Indicator & stat selection ─────────────────────────────────────
 ind_cols = [c for c in data.columns if c not in ("Theme","Country","Region","Income")]
 sel_inds = st.multiselect("Indicator(s)", ind_cols, default=ind_cols[:1])
 stat     = st.radio("Statistic", ["Mean","Median"], horizontal=True)
-func     = np.mean if stat=="Mean" else np.median
+agg_name = "mean" if stat=="Mean" else "median"
 
 # ─── 8. Group selection ────────────────────────────────────────────────
 group = st.selectbox("Group by", ["None","Country","Region","Income"], index=0)
 
 # ─── 9. CSV/XLSX download ──────────────────────────────────────────────
-csv = data.to_csv(index=False).encode()
-xls = io.BytesIO(); data.to_excel(xls,index=False); xls.seek(0)
+# Serialized once per filtered frame, not on every rerun
+@st.cache_data(show_spinner=False, max_entries=32)
+def _csv_bytes(_data, key):
+    return _data.to_csv(index=False).encode()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _xlsx_bytes(_data, key):
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as w:
+        _data.to_excel(w, index=False)
+    return buf.getvalue()
+
+# Payloads are only built when a button is clicked (Streamlit calls the
+# callable then); partial pins this run's frame
+csv = partial(_csv_bytes, data, data_key)
+xls = partial(_xlsx_bytes, data, data_key)
 st.download_button("⬇️ Download CSV",  csv, "data.csv","text/csv")
 st.download_button("⬇️ Download XLSX", xls, "data.xlsx",
                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
 # ─── 10. Prepare plotting DataFrame ───────────────────────────────────
-# Coerce selected columns to numeric
+# Coerce selected columns to numeric (shallow copy: only the replaced
+# columns are new); numeric columns were already parsed at load, only
+# text ones are left. Item assignment, since headers may be numbers.
+data = data.copy(deep=False)
 for c in sel_inds:
-    data[c] = pd.to_numeric(data[c], errors="coerce")
+    if data[c].dtype.kind not in "biuf":
+        data[c] = pd.to_numeric(data[c], errors="coerce")
+
+# Grouped results are cached per filtered frame, so toggling the chart
+# type (or going back to an earlier grouping) skips the groupby
+@st.cache_data(show_spinner=False, max_entries=128)
+def _agg(_data, key, by, cols, agg_name):
+    return _data.groupby(by, as_index=False, observed=True, sort=False)[list(cols)].agg(agg_name)
 
 # Build plot_df based on chart needs and grouping
 chart_type = st.selectbox("Chart type",
     ["Bar","Line","Scatter","Radar","Funnel","Map"]
 )
 if chart_type in ["Bar","Radar","Funnel","Map"]:
-    if group=="None":
-        if chart_type!="Map":
-            st.warning("Select a Group for this chart type.")
-            st.stop()
-        # Map will always group by Country if None
-        agg_df = data.groupby("Country",as_index=False)[sel_inds].agg(func)
-    else:
-        agg_df = data.groupby(group,as_index=False)[sel_inds].agg(func)
+    if group=="None" and chart_type!="Map":
+        st.warning("Select a Group for this chart type.")
+        st.stop()
+    # Map always groups by Country; one groupby covers every indicator
+    by = "Country" if chart_type == "Map" else group
+    agg_df = _agg(data, data_key, by, tuple(sel_inds), agg_name)
     plot_df = agg_df
 else:
-    plot_df = data.copy()
+    plot_df = data
 
 if plot_df.empty or not sel_inds:
     st.warning("No data to plot.")
@@ -174,59 +392,112 @@ discrete_color_map = {
     for i, cat in enumerate(sorted(all_cats))
 }
 
+# 3) Country name → ISO-3 lookup for the Map, built once per process
+ISO_OVERRIDES = {
+    "Bolivia, P.S.": "BOL", "Cape Verde": "CPV", "Congo, Republic of": "COG",
+    "Democratic Republic of the Congo": "COD", "Hong Kong, China": "HKG",
+    "Korea, Republic of (South Korea)": "KOR", "Lao PDR": "LAO",
+    "Macao, China": "MAC", "Micronesia": "FSM", "Micronesia, F. S.": "FSM",
+    "Palestine": "PSE", "Sint Maarten": "SXM", "São Tomé and Príncipe": "STP",
+    "Turkey": "TUR", "Venezuela, Bolivarian Republic": "VEN",
+}
 
-
-for ind in sel_inds:
-    st.markdown(f"### Indicator: **{ind}**")
-
-    # Prepare per‐indicator DataFrame
-    if chart_type in ["Bar","Radar","Funnel","Map"]:
-        if chart_type == "Map":
-            df_ind = data.groupby("Country", as_index=False)[[ind]].agg(func)
-        else:
-            df_ind = data.groupby(
-                group if group!="None" else "Country",
-                as_index=False
-            )[[ind]].agg(func)
+@st.cache_resource
+def _iso_map():
+    m = {}
+    for c in pycountry.countries:
+        for attr in ("alpha_3", "alpha_2", "name", "official_name", "common_name"):
+            v = getattr(c, attr, None)
+            if v:
+                m[v] = c.alpha_3
+    m.update(ISO_OVERRIDES)
+    return m
+
+# Line/Scatter switch to a WebGL canvas past a few hundred points;
+# smaller ones stay SVG (faster there, and each WebGL chart takes one
+# of the browser's few WebGL contexts)
+WEBGL_MIN_POINTS = 500
+
+def _render_mode(frame):
+    return "webgl" if len(frame) > WEBGL_MIN_POINTS else "svg"
+
+# 4) Bar/Line/Funnel are single-trace figures: build the px template
+#    (layout, axes, hover) once per shape and only swap the arrays in
+@st.cache_resource(max_entries=128)
+def _base_fig(kind, x, y, title, render_mode="svg"):
+    maker = {"Bar": px.bar, "Line": px.line, "Funnel": px.funnel}[kind]
+    extra = {"render_mode": render_mode} if kind == "Line" else {}
+    return maker(pd.DataFrame({x: [], y: []}), x=x, y=y, title=title, **extra)
+
+def _patched_fig(kind, frame, x, y, title):
+    fig = go.Figure(_base_fig(kind, x, y, title, _render_mode(frame)))
+    fig.update_traces(x=frame[x].to_numpy(), y=frame[y].to_numpy())
+    return fig
+
+# 5) Line/Scatter get every row: cap them with Largest-Triangle-Three-
+#    Buckets so figure size and browser work stay bounded
+MAX_POINTS = 2000
+
+def _lttb(x, y, n_out):
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = slice(hi, edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x, avg_y = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def _downsample(frame, y, x=None):
+    if len(frame) <= MAX_POINTS:
+        return frame
+    if x is None:
+        xs = np.arange(len(frame), dtype=float)
     else:
-        df_ind = data.copy()
-
-    # Clean and drop 999/NaN
-    df_ind[ind] = df_ind[ind].replace(999, np.nan)
-    df_ind = df_ind.dropna(subset=[ind])
-    if df_ind.empty:
-        st.warning(f"No data to plot for **{ind}**.")
-        continue
-
-    # Build the figure
-    if chart_type == "Bar":
-        fig = px.bar(
+        frame = frame.dropna(subset=[x, y]).sort_values(x)
+        xs = frame[x].to_numpy(dtype=float)
+    return frame.iloc[_lttb(xs, frame[y].to_numpy(dtype=float), MAX_POINTS)]
+
+# 6) Finished figures are cached as well: everything they depend on is
+#    fixed by the filtered frame (data_key) and the widget values
+@st.cache_data(show_spinner=False, max_entries=256)
+def _build_fig(_df_ind, _data, _cmap, key, chart_type, group, ind, sel_inds, stat):
+    df_ind, data, discrete_color_map = _df_ind, _data, _cmap
+    if chart_type == "Line":
+        df_ind = _downsample(df_ind, ind)
+
+    if chart_type in ["Bar","Line"]:
+        fig = _patched_fig(
+            chart_type,
             df_ind,
             x=(group if group!="None" else "Country"),
             y=ind,
             title=f"{stat} of {ind}"
         )
-    elif chart_type == "Line":
-        fig = px.line(
-            df_ind,
-            x=(group if group!="None" else "Country"),
-            y=ind,
-            title=f"{stat} of {ind}"
-        )
-    elif chart_type == "Scatter" and len(sel_inds)>=2:
+    elif chart_type == "Scatter":
         other = sel_inds[1] if sel_inds[0]==ind and len(sel_inds)>1 else sel_inds[0]
+        points = _downsample(data, ind, x=other)
         fig = px.scatter(
-            data,
+            points,
             x=other,
             y=ind,
             color=(group if group!="None" else None),
             hover_name="Country",
+            render_mode=_render_mode(points),
             title=f"{ind} vs {other}"
         )
-    elif chart_type == "Radar" and len(sel_inds)>=2:
+    elif chart_type == "Radar":
         long = df_ind.melt(
             id_vars=(group if group!="None" else "Country"),
-            value_vars=sel_inds
+            value_vars=list(sel_inds)
         )
         fig = px.line_polar(
             long,
@@ -239,15 +510,15 @@ for ind in sel_inds:
     elif chart_type == "Funnel":
         funnel = df_ind[ind].reset_index()
         funnel.columns = ["Stage","Value"]
-        fig = px.funnel(funnel, x="Value", y="Stage", title=f"Funnel: {ind}")
-    elif chart_type == "Map":
+        fig = _patched_fig("Funnel", funnel, x="Value", y="Stage", title=f"Funnel: {ind}")
+    else:  # Map
+        df_ind = df_ind.assign(iso=df_ind["Country"].astype(str).str.strip().map(_iso_map()))
         uniq = df_ind[ind].unique()
         if len(uniq) <= 10:
-            df_ind["cat"] = df_ind[ind].astype(str)
+            df_ind = df_ind.assign(cat=df_ind[ind].astype(str))
             fig = px.choropleth(
                 df_ind,
-                locations="Country",
-                locationmode="country names",
+                locations="iso",
                 color="cat",
                 hover_name="Country",
                 color_discrete_map=discrete_color_map,    # ← use the global map,
@@ -256,32 +527,67 @@ for ind in sel_inds:
         else:
             fig = px.choropleth(
                 df_ind,
-                locations="Country",
-                locationmode="country names",
+                locations="iso",
                 color=ind,
                 hover_name="Country",
                 color_continuous_scale="Blues",
                 title=f"{stat} of {ind}"
             )
-    else:
-        st.info("Select ≥2 indicators for Scatter/Radar.")
-        break
 
     fig.update_layout(margin=dict(l=20,r=20,t=40,b=20), height=450)
-
-    # Display the chart and capture clicks
-    st.plotly_chart(fig, use_container_width=True, key=f"chart_{ind}")
-    evs = plotly_events(fig, click_event=True, hover_event=False, key=f"evt_{ind}")
+    return fig
+
+# 7) Each chart runs as a fragment: clicking a point reruns only that
+#    chart and its profile link, not the loads/filters/other charts above
+@st.fragment
+def _chart_block(fig, ind, data, snap_urls):
+    sel = st.plotly_chart(
+        fig, use_container_width=True, key=f"chart_{ind}",
+        on_select="rerun", selection_mode="points"
+    )
+    evs = sel.selection.points if sel else []
     if evs:
         evt = evs[0]
-        country = evt.get("location") or evt.get("x") or evt.get("hovertext")
+        country = evt.get("hovertext") or evt.get("x")
+        if evt.get("location"):  # Map points carry the ISO-3 code
+            iso = _iso_map()
+            country = next(
+                (c for c in data["Country"].cat.categories
+                 if iso.get(str(c).strip()) == evt["location"]),
+                None
+            )
         if country:
-            snap = data.loc[data["Country"]==country, "SnapshotURL"].dropna()
-            if not snap.empty:
-                url = snap.iat[0]
+            url = snap_urls.get(str(country))
+            if url:
                 st.markdown(
                     f'<a href="{url}" target="_blank">▶️ Open full country profile</a>',
                     unsafe_allow_html=True
                 )
             else:
                 st.info(f"No snapshot available for {country}.")
+
+for ind in sel_inds:
+    st.markdown(f"### Indicator: **{ind}**")
+
+    # Prepare per‐indicator DataFrame
+    if chart_type in ["Bar","Radar","Funnel","Map"]:
+        # slice the shared aggregate (Radar plots every indicator)
+        df_ind = agg_df[[by] + (sel_inds if chart_type == "Radar" else [ind])]
+    else:
+        df_ind = data
+
+    # Drop 999 (missing code) and NaN in one pass over the column
+    vals = df_ind[ind].to_numpy(dtype=float)
+    df_ind = df_ind.iloc[(vals != 999) & ~np.isnan(vals)]
+    if df_ind.empty:
+        st.warning(f"No data to plot for **{ind}**.")
+        continue
+
+    if chart_type in ["Scatter","Radar"] and len(sel_inds) < 2:
+        st.info("Select ≥2 indicators for Scatter/Radar.")
+        break
+
+    fig = _build_fig(df_ind, data, discrete_color_map, data_key,
+                     chart_type, group, ind, tuple(sel_inds), stat)
+
+    _chart_block(fig, ind, data, snap_urls)